@@ -7,133 +7,951 @@ import runpod
 import subprocess
 import json
 import os
+import re
+import functools
 import base64
+import mmap
 import tempfile
 import shutil
+import queue
+import threading
+import collections
+import concurrent.futures
 import requests
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+try:
+    import PyNvVideoCodec as nvc
+except ImportError:
+    nvc = None  # Transcode with the FFmpeg CLI only
+
+# Source codecs / pixel formats that NVDEC can decode straight into CUDA
+# frames for h264_nvenc (other inputs, e.g. VP9, AV1 or 10-bit, decode on CPU)
+CUDA_DECODE_CODECS = {'h264', 'hevc'}
+CUDA_DECODE_PIX_FMTS = {'yuv420p', 'yuvj420p', 'nv12'}
+
+# Scratch space for per-job files; mount a tmpfs here so downloads and
+# FFmpeg I/O stay in memory (the system temp dir is used unless a tmpfs
+# is actually mounted there)
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR', '/scratch')
+
+# Read/write size for streamed downloads (one write syscall per MiB)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Parallel range downloads: connection count and smallest range per connection
+DOWNLOAD_CONNECTIONS = 8
+DOWNLOAD_MIN_PART_SIZE = 8 * 1024 * 1024
+
+# Log download progress every time this many more bytes have arrived
+DOWNLOAD_LOG_INTERVAL = 64 * 1024 * 1024
+
+# Chunk size and depth of the buffer between FFmpeg stdout and a streaming
+# upload (~256 MiB in flight before FFmpeg is back-pressured)
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_BUFFER_CHUNKS = 256
+
+# AAC source audio up to this bitrate is copied instead of re-encoded
+MAX_COPY_AUDIO_BITRATE = 320000
+
+# How much FFmpeg log output to keep for error messages
+FFMPEG_STDERR_TAIL_SIZE = 64 * 1024
+
+# key=value lines written by FFmpeg's -progress option
+FFMPEG_PROGRESS_LINE = re.compile(rb'^[a-z0-9_]+=')
+
+# Quality settings (crf is reused as the NVENC -cq target for VBR tiers)
+QUALITY_PRESETS = {
+    'high': {'crf': '23', 'preset': 'fast', 'nvenc': {'preset': 'p5', 'rc': 'vbr'}},
+    'medium': {'crf': '25', 'preset': 'faster', 'nvenc': {'preset': 'p4', 'rc': 'vbr'}},
+    'low': {
+        'crf': '28',
+        'preset': 'veryfast',
+        # Low-latency single-pass CBR without B-frames: fastest NVENC path
+        'nvenc': {'preset': 'p1', 'rc': 'cbr', 'tune': 'll', 'bitrate': '2M'},
+    },
+    'copy': {'codec': 'copy'},
+}
+
+# Batched clips starting further apart than this get their own input seek
+# instead of decoding (and discarding) the gap between them
+BATCH_SEEK_GAP = 30.0
+
+# Thumbnail grid timestamps handled per FFmpeg process (one input each)
+THUMBNAIL_BATCH_SIZE = 16
+
+# How far back to look for a keyframe when snapping a stream-copy clip start
+KEYFRAME_SEARCH_WINDOW = 10.0
+
+# Margin around a snapped keyframe when seeking: ffprobe prints pts_time
+# rounded to microseconds, which may fall just before the real timestamp
+KEYFRAME_SEEK_EPSILON = 0.001
+
+# Cached result of the one-time NVENC encoder probe (None = not probed yet)
+_nvenc_available: Optional[bool] = None
+
+def nvenc_available() -> bool:
+    """Check once whether this ffmpeg build can use the h264_nvenc encoder"""
+    global _nvenc_available
+
+    if _nvenc_available is None:
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-hide_banner', '-encoders'],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            _nvenc_available = result.returncode == 0 and 'h264_nvenc' in result.stdout
+        except Exception as e:
+            print(f"[Warning] Could not probe ffmpeg encoders: {e}")
+            _nvenc_available = False
+
+        print(f"[FFmpeg] NVENC available: {_nvenc_available}")
+
+    return _nvenc_available
+
+def verify_nvenc() -> None:
+    """
+    Check at startup that NVENC actually works on this worker
+
+    The encoder probe only shows h264_nvenc is compiled in. A tiny test
+    encode confirms a GPU is usable; if it fails (e.g. no GPU attached)
+    NVENC is disabled for this worker so jobs use libx264 instead of
+    failing.
+    """
+    global _nvenc_available
+
+    if not nvenc_available():
+        return
+
+    cmd = [
+        'ffmpeg',
+        '-hide_banner',
+        '-f', 'lavfi',
+        '-i', 'nullsrc=s=256x256:d=0.1',
+        '-c:v', 'h264_nvenc',
+        '-f', 'null',
+        '-'
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        if result.returncode != 0:
+            print(f"[Warning] NVENC test encode failed, using libx264:\n{result.stderr}")
+            _nvenc_available = False
+        else:
+            print(f"[FFmpeg] NVENC test encode succeeded")
+    except Exception as e:
+        print(f"[Warning] NVENC test encode failed, using libx264: {e}")
+        _nvenc_available = False
+
+def get_scratch_dir() -> Optional[str]:
+    """Return SCRATCH_DIR if a tmpfs is mounted there, otherwise None (system temp dir)"""
+    scratch_dir = os.path.realpath(SCRATCH_DIR)
+
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[1] == scratch_dir and fields[2] == 'tmpfs':
+                    return scratch_dir
+    except OSError:
+        pass
+
+    return None
 
 def download_file(url: str, destination: str) -> str:
-    """Download file from URL with progress tracking"""
+    """Download file from URL, using parallel byte ranges when the server supports them"""
     print(f"[Download] Fetching video from {url}")
 
     try:
-        response = requests.get(url, stream=True, timeout=300)
-        response.raise_for_status()
+        with requests.Session() as session:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_CONNECTIONS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
 
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
+            # Ask for the first byte: a 206 reply gives the size and confirms
+            # range support (works for presigned GET URLs, unlike HEAD)
+            response = session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=300)
+            response.raise_for_status()
 
-        with open(destination, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        progress = (downloaded / total_size) * 100
-                        if downloaded % (1024 * 1024) == 0:  # Log every MB
-                            print(f"[Download] Progress: {progress:.1f}%")
+            content_range = response.headers.get('content-range', '')
+            total_size = content_range.rpartition('/')[2]
+
+            if response.status_code == 206 and total_size.isdigit():
+                response.close()
+                downloaded = download_ranges(session, url, destination, int(total_size))
+            else:
+                if response.status_code == 206:
+                    # Size unknown, fetch the whole file in one request
+                    response.close()
+                    response = session.get(url, stream=True, timeout=300)
+                    response.raise_for_status()
+
+                total_size = int(response.headers.get('content-length', 0))
+                downloaded = 0
+                last_logged = 0
+
+                with open(destination, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            if downloaded - last_logged >= DOWNLOAD_LOG_INTERVAL:
+                                last_logged = downloaded
+                                if total_size > 0:
+                                    print(f"[Download] Progress: {downloaded / total_size * 100:.1f}%")
+                                else:
+                                    print(f"[Download] Progress: {downloaded / 1024 / 1024:.0f} MB")
 
         print(f"[Download] Complete: {downloaded / 1024 / 1024:.2f} MB")
         return destination
     except Exception as e:
         raise Exception(f"Download failed: {str(e)}")
 
+def download_ranges(
+    session: requests.Session,
+    url: str,
+    destination: str,
+    total_size: int
+) -> int:
+    """
+    Download a file as parallel byte ranges written in place
+
+    The file is preallocated, then up to DOWNLOAD_CONNECTIONS threads each
+    fetch one range and pwrite it at its offset. Returns bytes written.
+    """
+    part_count = max(1, min(DOWNLOAD_CONNECTIONS, total_size // DOWNLOAD_MIN_PART_SIZE))
+    part_size = -(-total_size // part_count)  # Ceiling division
+
+    print(f"[Download] {total_size / 1024 / 1024:.2f} MB in {part_count} parallel ranges")
+
+    fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    def fetch_range(start: int) -> int:
+        end = min(start + part_size, total_size) - 1
+        response = session.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=300)
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            raise Exception(f"Server ignored range request (HTTP {response.status_code})")
+
+        offset = start
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            view = memoryview(chunk)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+
+        if offset != end + 1:
+            raise Exception(f"Incomplete range {start}-{end}: got {offset - start} bytes")
+
+        print(f"[Download] Range {start}-{end} complete")
+        return offset - start
+
+    try:
+        # Reserve the blocks up front so parallel writers don't extend the file
+        try:
+            os.posix_fallocate(fd, 0, total_size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, total_size)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=part_count) as executor:
+            return sum(executor.map(fetch_range, range(0, total_size, part_size)))
+    finally:
+        os.close(fd)
+
+def upload_file(source: str, url: str) -> int:
+    """Stream a file to a presigned PUT URL (e.g. S3) and return its size"""
+    file_size = os.path.getsize(source)
+    print(f"[Upload] Sending {file_size / 1024 / 1024:.2f} MB to {url.split('?')[0]}")
+
+    try:
+        with open(source, 'rb') as f:
+            response = requests.put(
+                url,
+                data=f,
+                headers={'Content-Length': str(file_size)},
+                timeout=600
+            )
+        response.raise_for_status()
+
+        print(f"[Upload] Complete")
+        return file_size
+    except Exception as e:
+        raise Exception(f"Upload failed: {str(e)}")
+
+@functools.lru_cache(maxsize=16)
+def probe_video(input_path: str) -> Dict[str, Any]:
+    """
+    Probe container duration and stream info with a single ffprobe call
+
+    Results are cached per path so callers asking for different fields
+    don't spawn ffprobe again. Probing stops after the first megabyte of
+    packets: MP4 duration comes straight from the moov box, and 1 MB is
+    enough to see a keyframe for the pixel format.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-probesize', '1M',
+        '-analyzeduration', '0',
+        '-show_entries', 'format=duration,start_time'
+                         ':stream=codec_type,codec_name,pix_fmt,width,height,r_frame_rate,avg_frame_rate,bit_rate'
+                         ':stream_tags=rotate:stream_side_data=rotation',
+        '-of', 'json',
+        input_path
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
 def get_video_duration(input_path: str) -> float:
     """Get video duration using ffprobe"""
+    try:
+        duration = float(probe_video(input_path)['format']['duration'])
+        print(f"[Info] Video duration: {duration:.2f}s")
+        return duration
+    except Exception as e:
+        print(f"[Warning] Could not get video duration: {e}")
+        return 0.0
+
+def get_video_stream_info(input_path: str) -> Dict[str, Any]:
+    """Get codec, pixel format, size and frame rate of the first video stream using ffprobe"""
+    try:
+        streams = probe_video(input_path).get('streams', [])
+        info = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+        print(f"[Info] Video stream: codec={info.get('codec_name')}, pix_fmt={info.get('pix_fmt')}")
+        return info
+    except Exception as e:
+        print(f"[Warning] Could not get video stream info: {e}")
+        return {}
+
+def get_video_rotation(stream_info: Dict[str, Any]) -> int:
+    """Get the display rotation in degrees from a probed stream's side data or rotate tag"""
+    for side_data in stream_info.get('side_data_list', []):
+        if side_data.get('rotation'):
+            return int(float(side_data['rotation']))
+
+    return int(stream_info.get('tags', {}).get('rotate', 0) or 0)
+
+def get_container_start_time(input_path: str) -> float:
+    """Get the container start timestamp (non-zero for e.g. MPEG-TS) using ffprobe"""
+    try:
+        return float(probe_video(input_path)['format'].get('start_time', 0))
+    except Exception as e:
+        print(f"[Warning] Could not get container start time: {e}")
+        return 0.0
+
+def find_keyframe_before(input_path: str, time: float) -> Optional[float]:
+    """
+    Find the last video keyframe at or before time using ffprobe packet flags
+
+    time and the result are relative to the container start, like
+    ffmpeg -ss; ffprobe packet timestamps are absolute and are shifted.
+    """
+    start_offset = get_container_start_time(input_path)
+    absolute_time = time + start_offset
+
     try:
         cmd = [
             'ffprobe',
             '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
+            '-select_streams', 'v:0',
+            '-read_intervals', f"{max(0.0, absolute_time - KEYFRAME_SEARCH_WINDOW)}%{absolute_time + 0.001}",
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
             input_path
         ]
 
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        duration = float(result.stdout.strip())
-        print(f"[Info] Video duration: {duration:.2f}s")
-        return duration
+
+        keyframe_time = None
+        for line in result.stdout.splitlines():
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags and pts_time not in ('', 'N/A'):
+                relative_time = float(pts_time) - start_offset
+                if relative_time <= time:
+                    keyframe_time = max(keyframe_time or 0.0, relative_time)
+
+        return keyframe_time
     except Exception as e:
-        print(f"[Warning] Could not get video duration: {e}")
-        return 0.0
+        print(f"[Warning] Could not find keyframe: {e}")
+        return None
+
+def get_seek_time(start_time: float, quality: str) -> float:
+    """
+    Get the input seek target for a clip
+
+    Copy clips start on a snapped keyframe; seeking a hair past it makes
+    FFmpeg land on that keyframe even if its printed time rounded down.
+    """
+    if quality == 'copy':
+        return start_time + KEYFRAME_SEEK_EPSILON
+
+    return start_time
+
+def get_decode_args(input_path: str) -> List[str]:
+    """
+    Get FFmpeg input args for GPU decoding
+
+    8-bit H.264/HEVC inputs are decoded on the GPU (NVDEC) when NVENC is
+    available, so frames stay in video memory from decoder to encoder.
+    Returns an empty list when the input must be decoded on the CPU.
+    """
+    if not nvenc_available():
+        return []
+
+    stream_info = get_video_stream_info(input_path)
+    if (stream_info.get('codec_name') in CUDA_DECODE_CODECS
+            and stream_info.get('pix_fmt') in CUDA_DECODE_PIX_FMTS):
+        return [
+            '-hwaccel', 'cuda',                # Decode with NVDEC
+            '-hwaccel_output_format', 'cuda',  # Keep decoded frames in GPU memory
+            '-autorotate', '0',                # Can't transpose CUDA frames; keep the display matrix instead
+        ]
+
+    return []
+
+def get_encode_args(
+    input_path: str,
+    quality: str,
+    gpu_frames: bool = False,
+    movflags: str = '+faststart'
+) -> List[str]:
+    """
+    Get FFmpeg output args for a web-optimized H.264/AAC clip
+
+    Uses the h264_nvenc hardware encoder when available, otherwise libx264.
+    Set gpu_frames when the input is decoded into CUDA frames. The 'copy'
+    quality remuxes the source streams without re-encoding.
+    """
+    settings = QUALITY_PRESETS.get(quality, QUALITY_PRESETS['medium'])
+
+    if settings.get('codec') == 'copy':
+        return [
+            '-c', 'copy',                      # Stream copy (no decode/encode)
+            '-avoid_negative_ts', 'make_zero', # Shift timestamps to start at zero
+            '-movflags', movflags,             # Enable progressive download
+        ]
+
+    if nvenc_available():
+        nvenc = settings['nvenc']
+        video_args = [
+            '-c:v', 'h264_nvenc',              # Video codec (H.264, NVIDIA hardware encoder)
+            '-preset', nvenc['preset'],        # Encoding speed/compression (p1 fastest .. p7 best)
+        ]
+        if nvenc.get('tune'):
+            video_args += ['-tune', nvenc['tune']]  # Encoder tuning (ll = low latency)
+        if nvenc['rc'] == 'cbr':
+            video_args += [
+                '-rc', 'cbr',                      # Constant bitrate
+                '-b:v', nvenc['bitrate'],          # Fixed bitrate budget
+                '-multipass', '0',                 # Single pass
+                '-bf', '0',                        # No B-frames
+            ]
+        else:
+            video_args += [
+                '-rc', 'vbr',                      # Variable bitrate, constant quality
+                '-cq', settings['crf'],            # Quality (lower = better)
+                '-b:v', '0',                       # Let -cq drive the bitrate
+            ]
+        if not gpu_frames:
+            video_args += ['-pix_fmt', 'yuv420p']  # Pixel format for compatibility
+    else:
+        video_args = [
+            '-c:v', 'libx264',                 # Video codec (H.264)
+            '-preset', settings['preset'],     # Encoding speed/compression
+            '-crf', settings['crf'],           # Quality (lower = better, 23 is high quality)
+            '-pix_fmt', 'yuv420p',            # Pixel format for compatibility
+        ]
+
+    return [
+        *video_args,
+        *get_audio_args(input_path),
+        '-movflags', movflags,             # Enable progressive download
+    ]
+
+def get_audio_args(input_path: str) -> List[str]:
+    """
+    Get FFmpeg output args for the clip audio track
+
+    AAC sources at a reasonable bitrate are stream copied. Anything else is
+    re-encoded to AAC at the source sample rate (no resampling).
+    """
+    try:
+        streams = probe_video(input_path).get('streams', [])
+    except Exception as e:
+        print(f"[Warning] Could not get audio stream info: {e}")
+        streams = []
+
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    bit_rate = audio.get('bit_rate', '')
+
+    if (audio.get('codec_name') == 'aac'
+            and bit_rate.isdigit() and int(bit_rate) <= MAX_COPY_AUDIO_BITRATE):
+        return [
+            '-c:a', 'copy',                    # Audio already AAC, no re-encode
+        ]
+
+    return [
+        '-c:a', 'aac',                     # Audio codec
+        '-b:a', '128k',                    # Audio bitrate
+    ]
+
+def run_ffmpeg(
+    cmd: List[str],
+    output_paths: List[str],
+    timeout: int = 600,
+    duration: float = 0,
+    on_progress: Optional[Callable[[float], None]] = None
+) -> None:
+    """
+    Run an FFmpeg command and check that every output file has content
+
+    Progress is read line by line from FFmpeg's -progress output; when a
+    duration and on_progress are given, on_progress is called with the
+    percentage each time it advances by a whole percent. Only the last
+    64 KB of other stderr output is kept for error messages.
+    """
+
+    cmd = [cmd[0], '-nostats', '-progress', 'pipe:2', *cmd[1:]]
+    print(f"[FFmpeg] Command: {' '.join(cmd)}")
+
+    stderr_tail: collections.deque = collections.deque()
+    stderr_tail_size = 0
+    last_percent = -1
+
+    timed_out = threading.Event()
+
+    def kill_on_timeout() -> None:
+        timed_out.set()
+        process.kill()
+
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timer = threading.Timer(timeout, kill_on_timeout)
+        timer.start()
+
+        try:
+            for line in process.stderr:
+                if line.startswith(b'out_time_us='):
+                    if on_progress and duration > 0:
+                        value = line[len(b'out_time_us='):].strip()
+                        if value.isdigit():
+                            percent = min(100, int(int(value) / 1e6 / duration * 100))
+                            if percent > last_percent:
+                                last_percent = percent
+                                on_progress(percent)
+                elif not FFMPEG_PROGRESS_LINE.match(line):
+                    stderr_tail.append(line)
+                    stderr_tail_size += len(line)
+                    while stderr_tail_size > FFMPEG_STDERR_TAIL_SIZE:
+                        stderr_tail_size -= len(stderr_tail.popleft())
+
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            # Don't leave FFmpeg writing into the job directory if reading failed
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if timed_out.is_set() and returncode != 0:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        if returncode != 0:
+            stderr = b''.join(stderr_tail).decode('utf-8', errors='replace')
+            print(f"[FFmpeg] stderr output:\n{stderr}")
+            raise Exception(f"FFmpeg processing failed: {stderr}")
+
+        # Check if output files exist and have content
+        for output_path in output_paths:
+            if not os.path.exists(output_path):
+                raise Exception(f"Output file was not created: {os.path.basename(output_path)}")
+
+            if os.path.getsize(output_path) == 0:
+                raise Exception(f"Output file is empty: {os.path.basename(output_path)}")
+
+    except subprocess.TimeoutExpired:
+        raise Exception(f"FFmpeg processing timed out after {timeout // 60} minutes")
+    except Exception as e:
+        raise Exception(f"FFmpeg error: {str(e)}")
 
 def extract_clip(
     input_path: str,
     output_path: str,
     start_time: float,
     duration: float,
-    quality: str = 'high'
+    quality: str = 'high',
+    on_progress: Optional[Callable[[float], None]] = None
 ) -> str:
     """
     Extract clip using FFmpeg with optimized settings
 
+    Re-encodes go through PyNvVideoCodec first when it is installed.
+
     Quality presets:
-    - high: CRF 23, slower preset (best quality, slower)
-    - medium: CRF 25, fast preset (good quality, faster)
-    - low: CRF 28, veryfast preset (lower quality, fastest)
+    - high: CQ/CRF 23, slower preset (best quality, slower)
+    - medium: CQ/CRF 25, fast preset (good quality, faster)
+    - low: NVENC low-latency 2 Mbit/s CBR, or CRF 28 veryfast (lowest quality, fastest)
+    - copy: stream copy, no re-encode (start must be on a keyframe)
     """
 
-    print(f"[FFmpeg] Extracting clip: start={start_time}s, duration={duration}s, quality={quality}")
+    if nvc is not None and quality != 'copy' and nvenc_available():
+        try:
+            return extract_clip_nvc(
+                input_path, output_path, start_time, duration, quality,
+                on_progress=on_progress
+            )
+        except Exception as e:
+            print(f"[Warning] PyNvVideoCodec transcode failed, falling back to FFmpeg: {e}")
 
-    # Quality settings
-    quality_presets = {
-        'high': {'crf': '23', 'preset': 'fast'},
-        'medium': {'crf': '25', 'preset': 'faster'},
-        'low': {'crf': '28', 'preset': 'veryfast'},
-    }
+    print(f"[FFmpeg] Extracting clip: start={start_time}s, duration={duration}s, quality={quality}")
 
-    settings = quality_presets.get(quality, quality_presets['medium'])
+    decode_args = get_decode_args(input_path) if quality != 'copy' else []
 
     # FFmpeg command with web optimization
     cmd = [
         'ffmpeg',
-        '-ss', str(start_time),           # Start time (input seeking for speed)
+        *decode_args,
+        '-ss', str(get_seek_time(start_time, quality)),  # Start time (input seeking for speed)
         '-i', input_path,                  # Input file
         '-t', str(duration),               # Duration
-        '-c:v', 'libx264',                 # Video codec (H.264)
-        '-preset', settings['preset'],     # Encoding speed/compression
-        '-crf', settings['crf'],           # Quality (lower = better, 23 is high quality)
-        '-c:a', 'aac',                     # Audio codec
-        '-b:a', '128k',                    # Audio bitrate
-        '-ar', '44100',                    # Audio sample rate
-        '-movflags', '+faststart',         # Enable progressive download
-        '-pix_fmt', 'yuv420p',            # Pixel format for compatibility
+        *get_encode_args(input_path, quality, gpu_frames=bool(decode_args)),
         '-y',                              # Overwrite output
         output_path
     ]
 
-    print(f"[FFmpeg] Command: {' '.join(cmd)}")
+    run_ffmpeg(cmd, [output_path], duration=duration, on_progress=on_progress)
 
-    # Run FFmpeg with progress tracking
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minute timeout
+    file_size = os.path.getsize(output_path)
+    print(f"[FFmpeg] ✅ Clip extracted successfully: {file_size / 1024 / 1024:.2f} MB")
+    return output_path
+
+def get_nvc_encoder_options(quality: str) -> Dict[str, str]:
+    """
+    Get PyNvVideoCodec encoder options matching the tier's NVENC settings
+
+    Mirrors the h264_nvenc args from get_encode_args so both paths produce
+    the same rate control; raises for settings it cannot express.
+    """
+    settings = QUALITY_PRESETS.get(quality, QUALITY_PRESETS['medium'])
+    nvenc = settings['nvenc']
+
+    options = {
+        'codec': 'h264',
+        'preset': nvenc['preset'].upper(),
+        'tuning_info': 'low_latency' if nvenc.get('tune') == 'll' else 'high_quality',
+    }
+
+    if nvenc['rc'] == 'vbr':
+        options.update(
+            rc='vbr',                          # Variable bitrate, constant quality
+            cq=settings['crf'],                # Quality (lower = better)
+            bitrate='0'                        # Let cq drive the bitrate
         )
+    elif nvenc['rc'] == 'cbr':
+        options.update(
+            rc='cbr',                          # Constant bitrate
+            bitrate=nvenc['bitrate'],          # Fixed bitrate budget
+            multipass='disabled',              # Single pass
+            bf='0'                             # No B-frames
+        )
+    else:
+        raise Exception(f"Unsupported NVENC rate control for PyNvVideoCodec: {nvenc['rc']}")
 
-        if result.returncode != 0:
-            print(f"[FFmpeg] stderr output:\n{result.stderr}")
-            raise Exception(f"FFmpeg processing failed: {result.stderr}")
+    return options
 
-        # Check if output file exists and has content
-        if not os.path.exists(output_path):
-            raise Exception("Output file was not created")
+def extract_clip_nvc(
+    input_path: str,
+    output_path: str,
+    start_time: float,
+    duration: float,
+    quality: str = 'high',
+    on_progress: Optional[Callable[[float], None]] = None
+) -> str:
+    """
+    Extract clip with PyNvVideoCodec driving NVDEC/NVENC directly
 
-        file_size = os.path.getsize(output_path)
-        if file_size == 0:
-            raise Exception("Output file is empty")
+    FFmpeg is only used to cut the source at the keyframe before the clip
+    (stream copy) and to mux the encoded H.264 stream with the source
+    audio. Supports 8-bit H.264/HEVC inputs; raises for anything else so
+    the caller can fall back to the FFmpeg transcode.
+    """
 
-        print(f"[FFmpeg] ✅ Clip extracted successfully: {file_size / 1024 / 1024:.2f} MB")
-        return output_path
+    print(f"[NVC] Extracting clip: start={start_time}s, duration={duration}s, quality={quality}")
 
-    except subprocess.TimeoutExpired:
-        raise Exception("FFmpeg processing timed out after 10 minutes")
-    except Exception as e:
-        raise Exception(f"FFmpeg error: {str(e)}")
+    stream_info = get_video_stream_info(input_path)
+    if (stream_info.get('codec_name') not in CUDA_DECODE_CODECS
+            or stream_info.get('pix_fmt') not in CUDA_DECODE_PIX_FMTS):
+        raise Exception(f"Unsupported input for NVDEC: {stream_info.get('codec_name')} {stream_info.get('pix_fmt')}")
+
+    # Frames are selected by count and retimed at a fixed rate below, and the
+    # raw H.264 stream can't carry the display matrix
+    if stream_info.get('r_frame_rate') != stream_info.get('avg_frame_rate'):
+        raise Exception("Variable frame rate input")
+    if get_video_rotation(stream_info):
+        raise Exception("Rotated input")
+
+    frame_rate_num, _, frame_rate_den = stream_info.get('avg_frame_rate', '0/1').partition('/')
+    fps = float(frame_rate_num) / float(frame_rate_den or 1)
+    if fps <= 0:
+        raise Exception("Unknown frame rate")
+
+    keyframe_time = find_keyframe_before(input_path, start_time)
+    if keyframe_time is None:
+        raise Exception(f"No keyframe found before {start_time}s")
+
+    encoder_options = get_nvc_encoder_options(quality)
+    work_dir = os.path.dirname(output_path)
+    segment_path = os.path.join(work_dir, 'nvc_segment.mp4')
+    stream_path = os.path.join(work_dir, 'nvc_video.h264')
+
+    # Cut the video from the previous keyframe so decoding starts next to the clip
+    run_ffmpeg([
+        'ffmpeg',
+        '-ss', str(keyframe_time + KEYFRAME_SEEK_EPSILON),  # Land on the keyframe, not the one before
+        '-i', input_path,
+        '-t', str(duration + start_time - keyframe_time),
+        '-map', '0:v:0',
+        '-c', 'copy',
+        '-y',
+        segment_path
+    ], [segment_path])
+
+    # Frames are counted in display order: skip the pre-roll, encode the clip
+    skip_frames = round((start_time - keyframe_time) * fps)
+    end_frame = skip_frames + max(1, round(duration * fps))
+
+    demuxer = nvc.CreateDemuxer(filename=segment_path)
+    decoder = nvc.CreateDecoder(
+        gpuid=0,
+        codec=demuxer.GetNvCodecId(),
+        cudacontext=0,
+        cudastream=0,
+        usedevicememory=True
+    )
+    encoder = nvc.CreateEncoder(
+        int(stream_info['width']),
+        int(stream_info['height']),
+        'NV12',
+        False,                             # Input frames are already in GPU memory
+        fps=str(round(fps)),
+        **encoder_options
+    )
+
+    frame_index = 0
+    last_percent = -1
+    with open(stream_path, 'wb') as f:
+        for packet in demuxer:
+            for frame in decoder.Decode(packet):
+                if skip_frames <= frame_index < end_frame:
+                    f.write(bytearray(encoder.Encode(frame)))
+                    if on_progress:
+                        percent = int((frame_index - skip_frames + 1) / (end_frame - skip_frames) * 100)
+                        if percent > last_percent:
+                            last_percent = percent
+                            on_progress(percent)
+                frame_index += 1
+            if frame_index >= end_frame:
+                break
+        f.write(bytearray(encoder.EndEncode()))
+
+    # Mux the new video stream with the source audio
+    run_ffmpeg([
+        'ffmpeg',
+        '-framerate', stream_info['avg_frame_rate'],
+        '-i', stream_path,
+        '-ss', str(start_time),
+        '-t', str(duration),
+        '-i', input_path,
+        '-map', '0:v:0',
+        '-map', '1:a:0?',
+        '-c:v', 'copy',
+        *get_audio_args(input_path),
+        '-shortest',
+        '-movflags', '+faststart',
+        '-y',
+        output_path
+    ], [output_path])
+
+    file_size = os.path.getsize(output_path)
+    print(f"[NVC] ✅ Clip extracted successfully: {file_size / 1024 / 1024:.2f} MB")
+    return output_path
+
+def extract_clip_streaming(
+    input_path: str,
+    upload_url: str,
+    start_time: float,
+    duration: float,
+    quality: str = 'high',
+    timeout: int = 600
+) -> int:
+    """
+    Extract clip and upload it while FFmpeg is still encoding
+
+    FFmpeg writes fragmented MP4 to stdout; a reader thread moves 1 MiB
+    chunks into a bounded queue that is drained by a chunked HTTP PUT, so
+    the upload overlaps the encode instead of following it. The endpoint
+    must accept chunked transfer encoding (plain S3 presigned PUTs do not).
+    Returns the number of bytes uploaded.
+    """
+
+    print(f"[FFmpeg] Streaming clip: start={start_time}s, duration={duration}s, quality={quality}")
+
+    decode_args = get_decode_args(input_path) if quality != 'copy' else []
+
+    cmd = [
+        'ffmpeg',
+        *decode_args,
+        '-ss', str(get_seek_time(start_time, quality)),  # Start time (input seeking for speed)
+        '-i', input_path,                  # Input file
+        '-t', str(duration),               # Duration
+        *get_encode_args(
+            input_path,
+            quality,
+            gpu_frames=bool(decode_args),
+            movflags='frag_keyframe+empty_moov'  # Fragmented MP4, playable without seeking back
+        ),
+        '-f', 'mp4',
+        'pipe:1'                           # Write to stdout
+    ]
+
+    print(f"[FFmpeg] Command: {' '.join(cmd)}")
+
+    chunks: queue.Queue = queue.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+    uploaded = 0
+    drained = False
+
+    def read_output() -> None:
+        try:
+            while True:
+                chunk = process.stdout.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.put(chunk)
+        finally:
+            chunks.put(None)  # End of stream
+
+    def drain_chunks():
+        nonlocal uploaded, drained
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                drained = True
+                # Check FFmpeg before the final chunk is sent: raising here
+                # aborts the PUT so a failed encode never commits an object
+                returncode = process.wait()
+                if timed_out.is_set():
+                    raise Exception(f"FFmpeg processing timed out after {timeout // 60} minutes")
+                if returncode != 0:
+                    stderr_file.seek(0)
+                    stderr = stderr_file.read().decode('utf-8', errors='replace')
+                    print(f"[FFmpeg] stderr output:\n{stderr}")
+                    raise Exception(f"FFmpeg error: FFmpeg processing failed: {stderr}")
+                if uploaded == 0:
+                    raise Exception("FFmpeg error: Output stream is empty")
+                return
+            uploaded += len(chunk)
+            yield chunk
+
+    timed_out = threading.Event()
+
+    def kill_on_timeout() -> None:
+        timed_out.set()
+        process.kill()
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        # Killing FFmpeg closes stdout, which ends the stream and unblocks the upload
+        timer = threading.Timer(timeout, kill_on_timeout)
+        timer.start()
+        reader = threading.Thread(target=read_output, daemon=True)
+        reader.start()
+
+        try:
+            response = requests.put(upload_url, data=drain_chunks(), timeout=600)
+            response.raise_for_status()
+        except Exception as e:
+            process.kill()
+            process.wait()
+            # Unblock the reader so it can see EOF and exit
+            if not drained:
+                while chunks.get() is not None:
+                    pass
+            raise Exception(f"Streaming upload failed: {str(e)}")
+        finally:
+            timer.cancel()
+            reader.join()
+
+    print(f"[FFmpeg] ✅ Clip streamed successfully: {uploaded / 1024 / 1024:.2f} MB")
+    return uploaded
+
+def extract_clips(
+    input_path: str,
+    clips: List[Dict[str, Any]],
+    on_progress: Optional[Callable[[float], None]] = None
+) -> List[str]:
+    """
+    Extract several clips from one input in a single FFmpeg run
+
+    Each clip is a dict with start_time, duration, quality and output_path.
+    Clips starting within BATCH_SEEK_GAP seconds of each other share one
+    decode that is fanned out to one output per clip; each output then
+    seeks frame-accurately from its group's input seek point.
+    """
+
+    print(f"[FFmpeg] Extracting {len(clips)} clips in one pass")
+
+    decode_args = []
+    if any(clip['quality'] != 'copy' for clip in clips):
+        decode_args = get_decode_args(input_path)
+
+    # Group clips that are close together; each group gets its own input
+    # seek so decoding never runs through long gaps between clips
+    groups: List[List[Dict[str, Any]]] = []
+    for clip in sorted(clips, key=lambda clip: clip['start_time']):
+        if groups and clip['start_time'] - groups[-1][-1]['start_time'] <= BATCH_SEEK_GAP:
+            groups[-1].append(clip)
+        else:
+            groups.append([clip])
+
+    cmd = ['ffmpeg']
+
+    for group in groups:
+        cmd += [
+            *decode_args,
+            # Start time of earliest clip in group (input seeking for speed)
+            '-ss', str(get_seek_time(group[0]['start_time'], group[0]['quality'])),
+            '-i', input_path,                  # Input file
+        ]
+
+    for input_index, group in enumerate(groups):
+        base_time = get_seek_time(group[0]['start_time'], group[0]['quality'])
+        for clip in group:
+            offset = clip['start_time'] - base_time
+            if clip['quality'] == 'copy':
+                offset -= KEYFRAME_SEEK_EPSILON  # Don't drop the snapped keyframe itself
+            cmd += [
+                '-map', f'{input_index}:v:0',
+                '-map', f'{input_index}:a:0?',
+                '-ss', str(max(0.0, offset)),  # Exact offset from the input seek point
+                '-t', str(clip['duration']),
+                *get_encode_args(input_path, clip['quality'], gpu_frames=bool(decode_args)),
+                '-y',
+                clip['output_path']
+            ]
+
+    output_paths = [clip['output_path'] for clip in clips]
+    longest = max(clip['duration'] for clip in clips)
+    run_ffmpeg(cmd, output_paths, duration=longest, on_progress=on_progress)
+
+    total_size = sum(os.path.getsize(path) for path in output_paths)
+    print(f"[FFmpeg] ✅ {len(clips)} clips extracted successfully: {total_size / 1024 / 1024:.2f} MB")
+    return output_paths
 
 def generate_thumbnail(
     input_path: str,
@@ -171,6 +989,130 @@ def generate_thumbnail(
     except Exception as e:
         raise Exception(f"Thumbnail error: {str(e)}")
 
+def generate_thumbnail_grid(
+    input_path: str,
+    output_dir: str,
+    times: List[float]
+) -> List[Tuple[float, str]]:
+    """
+    Generate thumbnails at several timestamps with few FFmpeg runs
+
+    Each time gets its own fast input seek and a one-frame output, so only
+    the frames near each timestamp are decoded. Up to THUMBNAIL_BATCH_SIZE
+    times share one FFmpeg process. Times that yield no frame (e.g. inside
+    the last frame) are skipped. Returns (time, path) in ascending order.
+    """
+
+    times = sorted(set(times))
+
+    print(f"[Thumbnail] Generating {len(times)} thumbnails from {times[0]}s to {times[-1]}s")
+
+    thumbnails = []
+
+    for batch_start in range(0, len(times), THUMBNAIL_BATCH_SIZE):
+        batch = [
+            (time, os.path.join(output_dir, f'thumbnail_{index + 1:03d}.jpg'))
+            for index, time in enumerate(times[batch_start:batch_start + THUMBNAIL_BATCH_SIZE], batch_start)
+        ]
+
+        cmd = ['ffmpeg']
+
+        for time, _ in batch:
+            cmd += [
+                '-ss', str(time),              # Seek straight to the timestamp
+                '-i', input_path,
+            ]
+
+        for input_index, (_, output_path) in enumerate(batch):
+            cmd += [
+                '-map', f'{input_index}:v:0',
+                '-frames:v', '1',              # Single frame
+                '-q:v', '2',                   # JPEG quality (2 = high)
+                '-vf', 'scale=-2:720',         # Scale to 720p height
+                '-y',
+                output_path
+            ]
+
+        try:
+            run_ffmpeg(cmd, [], timeout=300)
+        except Exception as e:
+            raise Exception(f"Thumbnail error: {str(e)}")
+
+        for time, output_path in batch:
+            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                thumbnails.append((time, output_path))
+            else:
+                print(f"[Warning] No frame at {time}s, skipping thumbnail")
+
+    if not thumbnails:
+        raise Exception("Thumbnail error: No thumbnails were created")
+
+    total_size = sum(os.path.getsize(path) for _, path in thumbnails)
+    print(f"[Thumbnail] ✅ Generated {len(thumbnails)}: {total_size / 1024:.2f} KB")
+    return thumbnails
+
+def package_output(output_path: str, name: str, upload_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the result fields for an output file
+
+    Uploads to upload_url and returns {name}_url when given, otherwise
+    returns the file inline as base64 in {name}_data.
+    """
+    if upload_url:
+        file_size = upload_file(output_path, upload_url)
+        return {
+            f"{name}_url": upload_url.split('?')[0],  # Object URL without the signature
+            "file_size": file_size
+        }
+
+    file_size = os.path.getsize(output_path)
+
+    # Encode as base64 straight from the page cache (no read buffer copy)
+    output_base64 = ''
+    if file_size > 0:
+        with open(output_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as output_data:
+            output_base64 = base64.b64encode(output_data).decode('ascii')
+
+    return {
+        f"{name}_data": output_base64,
+        "file_size": file_size
+    }
+
+def validate_clip_range(start_time: float, duration: float, video_duration: float) -> float:
+    """Validate clip times and return the duration clamped to the video length"""
+    if start_time < 0:
+        raise ValueError("start_time must be >= 0")
+    if duration <= 0:
+        raise ValueError("duration must be > 0")
+    if video_duration > 0 and start_time + duration > video_duration:
+        print(f"[Warning] Requested clip extends beyond video duration, adjusting...")
+        duration = video_duration - start_time
+
+    return duration
+
+def resolve_copy_clip(
+    input_path: str,
+    start_time: float,
+    duration: float,
+    max_snap: float
+) -> Tuple[float, float, str]:
+    """
+    Snap a stream-copy clip to the previous keyframe
+
+    Returns (start_time, duration, quality). The clip keeps its end time
+    and starts up to max_snap seconds early; if no keyframe is that close
+    it falls back to a medium quality re-encode of the requested range.
+    """
+    keyframe_time = find_keyframe_before(input_path, start_time)
+
+    if keyframe_time is None or start_time - keyframe_time > max_snap:
+        print(f"[Warning] No keyframe within {max_snap}s of {start_time}s, re-encoding instead of copy")
+        return start_time, duration, 'medium'
+
+    print(f"[Info] Snapped copy start {start_time}s to keyframe at {keyframe_time}s")
+    return keyframe_time, duration + (start_time - keyframe_time), 'copy'
+
 def handler(event: Dict[str, Any]) -> Dict[str, Any]:
     """
     RunPod handler function
@@ -178,13 +1120,27 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
     Expected input:
     {
         "input": {
-            "operation": "extract_clip" | "generate_thumbnail",
+            "operation": "extract_clip" | "generate_thumbnail" | "generate_thumbnails",
             "video_url": "https://...",
             "start_time": 10.5,           # Required for extract_clip
             "duration": 30.0,              # Required for extract_clip
             "time": 15.0,                  # Required for generate_thumbnail
-            "quality": "high",             # Optional: high, medium, low
-            "output_format": "mp4"         # Optional, default: mp4
+            "times": [5.0, 15.0, 25.0],    # Required for generate_thumbnails
+            "quality": "high",             # Optional: high, medium, low, copy
+            "max_keyframe_snap": 1.0,      # Optional: max seconds a copy clip may start
+                                           # early to land on a keyframe
+            "output_format": "mp4",        # Optional, default: mp4
+            "upload_url": "https://...",   # Optional: presigned PUT URL for the output
+            "stream_upload": false,        # Optional: upload while encoding (fragmented
+                                           # MP4, needs chunked PUT support)
+            "clips": [                     # Optional for extract_clip: several
+                {                          # clips from the same video in one pass
+                    "start_time": 10.5,
+                    "duration": 30.0,
+                    "quality": "high",     # Optional, defaults to top-level quality
+                    "upload_url": "https://..."  # Optional: presigned PUT URL
+                }
+            ]
         }
     }
     """
@@ -193,6 +1149,9 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
 
     temp_dir = None
 
+    def report_progress(percent: float) -> None:
+        runpod.serverless.progress_update(event, f"Encoding: {percent:.0f}%")
+
     try:
         job_input = event.get('input', {})
 
@@ -204,7 +1163,7 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
             raise ValueError("video_url is required")
 
         # Create temp directory
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = tempfile.mkdtemp(dir=get_scratch_dir())
         print(f"[Handler] Working directory: {temp_dir}")
 
         # Determine input format from URL
@@ -216,8 +1175,10 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
         # Download video
         download_file(video_url, input_path)
 
-        # Get video info
-        video_duration = get_video_duration(input_path)
+        # Get video info (single thumbnails don't need the duration)
+        video_duration = 0.0
+        if operation != 'generate_thumbnail':
+            video_duration = get_video_duration(input_path)
 
         if operation == 'generate_thumbnail':
             # Generate thumbnail
@@ -226,55 +1187,131 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
 
             generate_thumbnail(input_path, output_path, time)
 
-            # Read output file
-            with open(output_path, 'rb') as f:
-                output_data = f.read()
-
-            # Encode as base64
-            output_base64 = base64.b64encode(output_data).decode('utf-8')
-
             result = {
                 "success": True,
                 "operation": "generate_thumbnail",
-                "thumbnail_data": output_base64,
-                "file_size": len(output_data),
+                **package_output(output_path, 'thumbnail', job_input.get('upload_url')),
                 "format": "jpg",
                 "time": time
             }
 
+        elif operation == 'generate_thumbnails':
+            # Generate several thumbnails in one decode pass
+            times = sorted(set(float(time) for time in job_input.get('times') or []))
+            if not times:
+                raise ValueError("times is required for generate_thumbnails")
+            if times[0] < 0:
+                raise ValueError("times must be >= 0")
+            if video_duration > 0 and times[-1] >= video_duration:
+                raise ValueError(f"times must be < video duration ({video_duration:.2f}s)")
+
+            thumbnails = generate_thumbnail_grid(input_path, temp_dir, times)
+
+            result = {
+                "success": True,
+                "operation": "generate_thumbnails",
+                "thumbnails": [
+                    {**package_output(output_path, 'thumbnail'), "time": time}
+                    for time, output_path in thumbnails
+                ],
+                "format": "jpg"
+            }
+
+        elif len(job_input.get('clips') or []) > 1:
+            # Extract several clips from the same video in one FFmpeg pass
+            output_format = job_input.get('output_format', 'mp4')
+            max_keyframe_snap = float(job_input.get('max_keyframe_snap', 1.0))
+
+            clips = []
+            for index, clip_input in enumerate(job_input['clips']):
+                start_time = float(clip_input.get('start_time', 0))
+                duration = validate_clip_range(
+                    start_time,
+                    float(clip_input.get('duration', 30)),
+                    video_duration
+                )
+                quality = clip_input.get('quality', job_input.get('quality', 'medium'))
+
+                if quality == 'copy':
+                    start_time, duration, quality = resolve_copy_clip(
+                        input_path, start_time, duration, max_keyframe_snap
+                    )
+
+                clips.append({
+                    'start_time': start_time,
+                    'duration': duration,
+                    'quality': quality,
+                    'output_path': os.path.join(temp_dir, f'output_{index}.{output_format}'),
+                    'upload_url': clip_input.get('upload_url')
+                })
+
+            # Extract clips
+            extract_clips(input_path, clips, on_progress=report_progress)
+
+            clip_results = []
+            for clip in clips:
+                clip_results.append({
+                    **package_output(clip['output_path'], 'clip', clip['upload_url']),
+                    "start_time": clip['start_time'],
+                    "duration": clip['duration'],
+                    "quality": clip['quality']
+                })
+
+            result = {
+                "success": True,
+                "operation": "extract_clip",
+                "clips": clip_results,
+                "format": output_format,
+                "video_duration": video_duration
+            }
+
         else:
-            # Extract clip
-            start_time = float(job_input.get('start_time', 0))
-            duration = float(job_input.get('duration', 30))
-            quality = job_input.get('quality', 'medium')
+            # Extract clip (a single-entry "clips" list is treated as a plain request)
+            clip_input = {**job_input, **(job_input.get('clips') or [{}])[0]}
+            start_time = float(clip_input.get('start_time', 0))
+            duration = float(clip_input.get('duration', 30))
+            quality = clip_input.get('quality', 'medium')
             output_format = job_input.get('output_format', 'mp4')
 
+            if job_input.get('stream_upload') and output_format != 'mp4':
+                raise ValueError("stream_upload only supports mp4 output_format")
+
             # Validate times
-            if start_time < 0:
-                raise ValueError("start_time must be >= 0")
-            if duration <= 0:
-                raise ValueError("duration must be > 0")
-            if video_duration > 0 and start_time + duration > video_duration:
-                print(f"[Warning] Requested clip extends beyond video duration, adjusting...")
-                duration = video_duration - start_time
+            duration = validate_clip_range(start_time, duration, video_duration)
+
+            if quality == 'copy':
+                start_time, duration, quality = resolve_copy_clip(
+                    input_path,
+                    start_time,
+                    duration,
+                    float(job_input.get('max_keyframe_snap', 1.0))
+                )
 
-            output_path = os.path.join(temp_dir, f'output.{output_format}')
+            upload_url = clip_input.get('upload_url')
 
-            # Extract clip
-            extract_clip(input_path, output_path, start_time, duration, quality)
+            if upload_url and job_input.get('stream_upload'):
+                # Upload while encoding
+                output = {
+                    "clip_url": upload_url.split('?')[0],
+                    "file_size": extract_clip_streaming(
+                        input_path, upload_url, start_time, duration, quality
+                    )
+                }
+            else:
+                output_path = os.path.join(temp_dir, f'output.{output_format}')
 
-            # Read output file
-            with open(output_path, 'rb') as f:
-                output_data = f.read()
+                # Extract clip
+                extract_clip(
+                    input_path, output_path, start_time, duration, quality,
+                    on_progress=report_progress
+                )
 
-            # Encode as base64
-            output_base64 = base64.b64encode(output_data).decode('utf-8')
+                output = package_output(output_path, 'clip', upload_url)
 
             result = {
                 "success": True,
                 "operation": "extract_clip",
-                "clip_data": output_base64,
-                "file_size": len(output_data),
+                **output,
                 "format": output_format,
                 "start_time": start_time,
                 "duration": duration,
@@ -306,5 +1343,6 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
 # Start the RunPod serverless handler
 if __name__ == "__main__":
     print("[RunPod] Starting ClipForge FFmpeg handler...")
+    verify_nvenc()
     print("[RunPod] Ready to process video jobs")
     runpod.serverless.start({"handler": handler})